@@ -1,32 +1,169 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import os
+
+# Uma thread OpenMP por instância do Tesseract, já que o paralelismo vem das threads
+# de OCR; precisa ser definido antes de carregar as bibliotecas nativas (cv2, tesserocr),
+# por isso fica antes de todos os imports
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
 import pdfplumber
 import pytesseract
 from pdf2image import convert_from_path
 import re
-import os
+import hashlib
+import tempfile
 import cv2
 import numpy as np
-from typing import List, Dict, Optional
-from PIL import Image
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import BinaryIO, List, Dict, Optional, Tuple
+import threading
 import uvicorn
 
-app = FastAPI()
+# tesserocr é opcional: mantém o modelo carregado entre páginas; sem ele o OCR usa o binário via pytesseract
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM, RIL, iterate_level
+except ImportError:
+    PyTessBaseAPI = None
+
+app = FastAPI(default_response_class=ORJSONResponse)
+
+pytesseract.pytesseract.tesseract_cmd = '/usr/bin/tesseract'
+
+# Tamanho dos blocos usados na cópia do upload para o disco
+_TAMANHO_BLOCO = 1 << 20
+
+# Pasta opcional para os uploads (ex.: um tmpfs); sem ela vale o padrão do tempfile (TMPDIR)
+_PASTA_UPLOADS = os.environ.get("PASTA_UPLOADS") or None
+
+class _CacheLRU:
+    """Cache LRU de tamanho limitado, seguro para uso entre threads"""
+
+    def __init__(self, tamanho: int):
+        self._tamanho = tamanho
+        self._itens: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave: str):
+        """Retorna o valor da chave (ou None), marcando-o como usado recentemente"""
+        with self._lock:
+            valor = self._itens.get(chave)
+            if valor is not None:
+                self._itens.move_to_end(chave)
+            return valor
+
+    def put(self, chave: str, valor) -> None:
+        """Armazena o valor, descartando o item menos usado se o limite for excedido"""
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            if len(self._itens) > self._tamanho:
+                self._itens.popitem(last=False)
+
+# Resultados já processados, indexados pelo hash do PDF (um cache por processo do uvicorn)
+_CACHE_RESULTADOS = _CacheLRU(256)
+
+# Texto de OCR por página, indexado pelo hash da página renderizada (também por processo)
+_CACHE_PAGINAS = _CacheLRU(4096)
+
+# Mínimo de caracteres na primeira página para tentar a extração textual
+_MIN_CARACTERES_TEXTO = 50
+
+# Fração de pixels puramente pretos/brancos a partir da qual a página já é binária
+_FRACAO_BINARIA = 0.9
+
+# Processos do uvicorn; cada um importa o módulo e cria o seu próprio pool de OCR e
+# os seus próprios caches. O paralelismo das páginas já vem do pool, então poucos
+# processos bastam e um PDF reenviado tem mais chance de cair num cache que já o contém.
+# Lido de WEB_CONCURRENCY, a mesma variável que o uvicorn usa como padrão de --workers,
+# para que o pool seja dimensionado igual também fora do `python main.py`
+_WORKERS_UVICORN = int(os.environ.get("WEB_CONCURRENCY", min(2, os.cpu_count() or 1)))
+
+# Núcleos divididos entre os processos: uma instância do Tesseract por núcleo no total,
+# cada uma limitada a uma thread OpenMP
+_WORKERS_OCR = max(1, (os.cpu_count() or 1) // _WORKERS_UVICORN)
+
+# Threads persistentes do OCR, cada uma com sua própria instância do Tesseract
+_EXECUTOR_OCR = ThreadPoolExecutor(max_workers=_WORKERS_OCR)
+_TESSERACT_LOCAL = threading.local()
+
+# Resolução inicial do OCR e resolução usada nas páginas de baixa confiança
+_DPI_OCR = 200
+_DPI_OCR_ALTA = 300
+_CONFIANCA_MINIMA = 70
+
+# Padrões compilados uma única vez na importação do módulo
+
+# Campos do cabeçalho em uma única alternação; cada alternativa fica dentro de um
+# lookahead para não consumir texto, e assim cada campo é encontrado na mesma
+# posição em que uma busca isolada o encontraria
+_RE_CABECALHO = re.compile(
+    r"(?=NOME\s*(?P<nome>[A-ZÀ-Ú][A-ZÀ-Ú \t]*?)[ \t]*(?=\n|MATR|ADMISSÃO|$))"
+    r"|(?=MATR[ÍI]CULA[\s\n]*(?P<matricula>\d+))"
+    r"|(?=(?:REFERÊNCIA|COMPETÊNCIA)[\s\n]*(?P<referencia>\d{2}/\d{4}))"
+    r"|(?=(?P<referencia_sri>\d{2}/\d{4})(?=\s+SRI-SISTEMA))",
+    re.IGNORECASE
+)
+_CAMPOS_CABECALHO = ("nome", "matricula", "referencia")  # Encerram a varredura
+
+# Marcos da seção de vantagens, localizados em sequência sem retrocesso
+_RE_INICIO_VANTAGENS = re.compile(r"VANTAGENS|PROVENTOS", re.IGNORECASE)
+_RE_CABECALHO_TABELA = re.compile(r"cód|COD|DISCRIMINAÇÃO", re.IGNORECASE)
+_RE_FIM_VANTAGENS = re.compile(r"TOTAL\s+DE\s+VANTAGENS|\n\n", re.IGNORECASE)
+
+# Linha da tabela de vantagens, com ou sem percentual; sem percentual o valor encerra a linha
+# ([^\S\n] é espaço em branco exceto quebra de linha, para nenhum casamento cruzar linhas)
+_RE_VANTAGEM = re.compile(
+    r"^[^\S\n]*(?P<cod>\d{5})[^\S\n]+(?P<desc>(?:[A-ZÀ-Ú./-]|[^\S\n])+?)[^\S\n]+"
+    r"(?:(?P<pct>[\d.,]+)%?[^\S\n]+(?=[\d.,]))?(?P<valor>[\d.,]+)(?(pct)|[^\S\n]*$)",
+    re.IGNORECASE | re.MULTILINE
+)
+
+# Formato brasileiro para float: remove o separador de milhar e troca a vírgula decimal
+_TRADUCAO_VALOR = str.maketrans({'.': None, ',': '.'})
+
+# Correções de erros comuns de OCR, apenas em palavras inteiras
+_CORRECOES = (
+    (r'\bGOVERNO\s+D[EO]\s+ESTAD[OA]\b', 'GOVERNO DO ESTADO'),
+    (r'\bMATRICULA\b', 'MATRÍCULA'),
+    (r'\bContraçheque\b', 'Contracheque'),
+    (r'\b(?P<digito>\d)o\b', r'\g<digito>º'),
+    (r'\bSRH\b-?', 'SRI-')
+)
+
+# Todas as correções em uma única alternação; o grupo c<i> identifica a correção aplicada
+_RE_CORRECOES = re.compile("|".join(
+    f"(?P<c{i}>{padrao})" for i, (padrao, _) in enumerate(_CORRECOES)
+))
+
+def _substituir_correcao(match: re.Match) -> str:
+    """Retorna a substituição da correção que casou"""
+    return match.expand(_CORRECOES[int(match.lastgroup[1:])][1])
+
+def _api_tesseract() -> "PyTessBaseAPI":
+    """Retorna a instância do Tesseract da thread atual, criando-a no primeiro uso"""
+    api = getattr(_TESSERACT_LOCAL, "api", None)
+    if api is None:
+        api = PyTessBaseAPI(lang='por', psm=PSM.SINGLE_BLOCK, oem=OEM.LSTM_ONLY)
+        _TESSERACT_LOCAL.api = api
+    return api
 
 class ContrachequeProcessor:
     def __init__(self):
-        self.tessconfig = r'--oem 3 --psm 6 -l por'
-        pytesseract.pytesseract.tesseract_cmd = '/usr/bin/tesseract'
+        self.tessconfig = r'--oem 1 --psm 6 -l por'
         
-        # Mapeamento completo das vantagens alvo
+        # Mapeamento completo das vantagens alvo: código -> (descrição, tem_percentual)
         self.vantagens_alvo = {
-            '00002': {'descricao': 'VENCIMENTO', 'tem_percentual': False},
-            '00017': {'descricao': 'GRAT.A.FIS', 'tem_percentual': True},
-            '00018': {'descricao': 'GRAT.A.FIS JUD', 'tem_percentual': True},
-            '00146': {'descricao': 'AD.T.SERV', 'tem_percentual': True},
-            '00153': {'descricao': 'CET-H.ESP', 'tem_percentual': True},
-            '00279': {'descricao': 'PDF', 'tem_percentual': False},
-            '00170': {'descricao': 'AD.NOT.INCORP', 'tem_percentual': True},
-            '00212': {'descricao': 'DIF SALARIO/RRA', 'tem_percentual': True}
+            '00002': ('VENCIMENTO', False),
+            '00017': ('GRAT.A.FIS', True),
+            '00018': ('GRAT.A.FIS JUD', True),
+            '00146': ('AD.T.SERV', True),
+            '00153': ('CET-H.ESP', True),
+            '00279': ('PDF', False),
+            '00170': ('AD.NOT.INCORP', True),
+            '00212': ('DIF SALARIO/RRA', True)
         }
 
     def processar_documento(self, pdf_path: str) -> Dict:
@@ -35,11 +172,11 @@ class ContrachequeProcessor:
             text = self._extrair_texto(pdf_path)
             
             # Extração dos campos com fallback
+            campos = self._extrair_cabecalho(text)
             dados = {
-                "nome_completo": self._extrair_campo(r"NOME[\s\n]*([A-ZÀ-Ú\s]+)(?=\n|MATR|ADMISSÃO|$)", text),
-                "matricula": self._extrair_campo(r"MATR[ÍI]CULA[\s\n]*(\d+)", text),
-                "mes_ano_referencia": self._extrair_campo(r"(?:REFERÊNCIA|COMPETÊNCIA)[\s\n]*(\d{2}/\d{4})", text) 
-                          or self._extrair_campo(r"\d{2}/\d{4}(?=\s+SRI-SISTEMA)", text),
+                "nome_completo": campos["nome"],
+                "matricula": campos["matricula"],
+                "mes_ano_referencia": campos["referencia"] or campos["referencia_sri"],
                 "vantagens": self._extrair_vantagens(text)
             }
             
@@ -54,120 +191,292 @@ class ContrachequeProcessor:
         try:
             # Tenta extração textual primeiro
             with pdfplumber.open(pdf_path) as pdf:
-                text = "\n".join(page.extract_text() or "" for page in pdf.pages)
-                if len(text.strip()) > 100:  # Limite mínimo de texto
-                    return text
+                total_paginas = len(pdf.pages)
+                # Documento escaneado: a primeira página não tem camada de texto
+                if pdf.pages and len(pdf.pages[0].chars) >= _MIN_CARACTERES_TEXTO:
+                    text = "\n".join(page.extract_text() or "" for page in pdf.pages)
+                    if len(text.strip()) > 100:  # Limite mínimo de texto
+                        return text
                     
-            # Fallback para OCR
-            images = convert_from_path(pdf_path, dpi=400, grayscale=True)
-            text = "\n".join(pytesseract.image_to_string(
-                self._preprocessar_imagem(img), 
-                config=self.tessconfig
-            ) for img in images)
+            # Fallback para OCR, sempre no pool (também com uma só página), para que o número
+            # de instâncias do Tesseract continue limitado entre requisições
+            with tempfile.TemporaryDirectory() as pasta:
+                text = self._ocr_paginas(pdf_path, total_paginas, pasta)
             
             return self._corrigir_texto(text)
             
         except Exception as e:
             raise RuntimeError(f"Falha na extração de texto: {str(e)}")
 
-    def _preprocessar_imagem(self, image):
-        """Melhora a qualidade da imagem para OCR"""
-        img_array = np.array(image)
-        gray = cv2.cvtColor(img_array, cv2.COLOR_BGR2GRAY)
-        denoised = cv2.fastNlMeansDenoising(gray, h=30)
+    def _ocr_paginas(self, pdf_path: str, total_paginas: int, pasta: str) -> str:
+        """Aplica OCR nas páginas em paralelo; cada thread renderiza a sua página, então a
+        renderização de uma página se sobrepõe ao OCR das demais (por isso sem thread_count)"""
+        futuros = [
+            _EXECUTOR_OCR.submit(self._ocr_pagina, pdf_path, pagina, pasta)
+            for pagina in range(1, total_paginas + 1)
+        ]
+        try:
+            return "\n".join(futuro.result() for futuro in futuros)
+        finally:
+            # Em caso de erro, nenhuma página pode continuar gravando na pasta temporária
+            # enquanto ela é removida
+            for futuro in futuros:
+                futuro.cancel()
+            wait(futuros)
+
+    def _ocr_pagina(self, pdf_path: str, pagina: int, pasta: str) -> str:
+        """Renderiza e aplica OCR em uma página, usando alta resolução se a confiança for baixa"""
+        caminho_imagem = self._renderizar_pagina(pdf_path, pagina, _DPI_OCR, pasta)
+        with open(caminho_imagem, "rb") as f:
+            conteudo = f.read()
+        
+        # Páginas idênticas (mesmos pixels) já reconhecidas reaproveitam o texto
+        chave = hashlib.blake2b(conteudo, digest_size=16).hexdigest()
+        text = _CACHE_PAGINAS.get(chave)
+        if text is not None:
+            return text
+        
+        text, confianca = self._ocr_imagem(self._decodificar_pagina(conteudo, pagina))
+        if confianca < _CONFIANCA_MINIMA:
+            caminho_imagem = self._renderizar_pagina(pdf_path, pagina, _DPI_OCR_ALTA, pasta)
+            with open(caminho_imagem, "rb") as f:
+                text, _ = self._ocr_imagem(self._decodificar_pagina(f.read(), pagina))
+        
+        _CACHE_PAGINAS.put(chave, text)
+        return text
+
+    def _decodificar_pagina(self, conteudo: bytes, pagina: int) -> np.ndarray:
+        """Decodifica o PGM do poppler direto para um array de 8 bits, sem passar pelo PIL"""
+        image = cv2.imdecode(np.frombuffer(conteudo, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise ValueError(f"Imagem renderizada da página {pagina} inválida ou truncada")
+        return image
+
+    def _renderizar_pagina(self, pdf_path: str, pagina: int, dpi: int, pasta: str) -> str:
+        """Renderiza uma página em tons de cinza na pasta e retorna o caminho da imagem"""
+        return convert_from_path(
+            pdf_path, dpi=dpi, grayscale=True,
+            first_page=pagina, last_page=pagina,
+            output_folder=pasta, paths_only=True
+        )[0]
+
+    def _ocr_imagem(self, image: np.ndarray) -> Tuple[str, float]:
+        """Aplica pré-processamento e OCR, retornando o texto e a confiança média"""
+        processada = self._preprocessar_imagem(image)
+        if PyTessBaseAPI is not None:
+            # Entrega os pixels diretamente à API, sem passar por uma imagem PIL
+            altura, largura = processada.shape
+            api = _api_tesseract()
+            api.SetImageBytes(processada.tobytes(), largura, altura, 1, largura)
+            api.Recognize()
+            return self._montar_texto(self._dados_tesserocr(api)), float(api.MeanTextConf())
+        
+        dados = pytesseract.image_to_data(
+            processada,
+            config=self.tessconfig,
+            output_type=pytesseract.Output.DICT
+        )
+        confiancas = [
+            float(conf) for conf, palavra in zip(dados["conf"], dados["text"])
+            if float(conf) >= 0 and palavra.strip()
+        ]
+        confianca = sum(confiancas) / len(confiancas) if confiancas else 0.0
+        return self._montar_texto(dados), confianca
+
+    def _dados_tesserocr(self, api: "PyTessBaseAPI") -> Dict:
+        """Converte as palavras reconhecidas pelo tesserocr no formato do image_to_data"""
+        dados = {campo: [] for campo in ("text", "conf", "block_num", "par_num", "line_num", "left")}
+        iterador = api.GetIterator()
+        if iterador is None:
+            return dados
+        
+        # Numeração como no image_to_data: parágrafos por bloco e linhas por parágrafo
+        bloco = paragrafo = linha = 0
+        for palavra in iterate_level(iterador, RIL.WORD):
+            if palavra.IsAtBeginningOf(RIL.BLOCK):
+                bloco, paragrafo = bloco + 1, 0
+            if palavra.IsAtBeginningOf(RIL.PARA):
+                paragrafo, linha = paragrafo + 1, 0
+            if palavra.IsAtBeginningOf(RIL.TEXTLINE):
+                linha += 1
+            caixa = palavra.BoundingBox(RIL.WORD)
+            if caixa is None:
+                continue
+            dados["text"].append(palavra.GetUTF8Text(RIL.WORD) or "")
+            dados["conf"].append(palavra.Confidence(RIL.WORD))
+            dados["block_num"].append(bloco)
+            dados["par_num"].append(paragrafo)
+            dados["line_num"].append(linha)
+            dados["left"].append(caixa[0])
+        return dados
+
+    def _montar_texto(self, dados: Dict) -> str:
+        """Reconstrói o texto da página a partir das palavras do OCR, em ordem horizontal"""
+        paragrafos = {}
+        for palavra, conf, bloco, paragrafo, linha, esquerda in zip(
+            dados["text"], dados["conf"], dados["block_num"],
+            dados["par_num"], dados["line_num"], dados["left"]
+        ):
+            # Entradas estruturais (conf -1) e palavras vazias não geram texto
+            if float(conf) < 0 or not palavra.strip():
+                continue
+            linhas = paragrafos.setdefault((bloco, paragrafo), {})
+            linhas.setdefault(linha, []).append((esquerda, palavra))
+        
+        # Mantém a linha em branco entre parágrafos, como no image_to_string
+        return "\n\n".join(
+            "\n".join(" ".join(p for _, p in sorted(palavras)) for palavras in linhas.values())
+            for linhas in paragrafos.values()
+        )
+
+    def _preprocessar_imagem(self, gray: np.ndarray) -> np.ndarray:
+        """Melhora a qualidade da imagem para OCR, a partir da página em tons de cinza (uint8)"""
+        # Página já praticamente binária: dispensa filtro e limiarização
+        histograma = np.bincount(gray.ravel(), minlength=256)
+        if histograma[0] + histograma[255] > _FRACAO_BINARIA * gray.size:
+            return gray
+        
+        denoised = cv2.medianBlur(gray, 3)
         _, threshold = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        return Image.fromarray(threshold)
+        return threshold
 
     def _corrigir_texto(self, text: str) -> str:
         """Corrige erros comuns de OCR"""
-        correcoes = {
-            r'\bGOVERNO\s+D[EO]\s+ESTAD[OA]\b': 'GOVERNO DO ESTADO',
-            r'\bMATR[ÍI]CULA\b': 'MATRÍCULA',
-            r'\bContra[çc]heque\b': 'Contracheque',
-            r'\b(\d)o\b': r'\1º',
-            r'\bSRH-?\b': 'SRI-'
-        }
-        for padrao, substituicao in correcoes.items():
-            text = re.sub(padrao, substituicao, text)
-        return text
+        return _RE_CORRECOES.sub(_substituir_correcao, text)
 
-    def _extrair_campo(self, padrao: str, text: str) -> Optional[str]:
-        """Extrai um campo específico com tratamento de erro"""
-        try:
-            match = re.search(padrao, text, re.IGNORECASE)
-            return match.group(1).strip() if match else None
-        except:
+    def _extrair_cabecalho(self, text: str) -> Dict[str, Optional[str]]:
+        """Extrai os campos do cabeçalho em uma única varredura do texto"""
+        campos = dict.fromkeys(_RE_CABECALHO.groupindex)
+        for match in _RE_CABECALHO.finditer(text):
+            campo = match.lastgroup
+            if campos[campo] is None:
+                campos[campo] = match.group(campo).strip()
+                if all(campos[c] is not None for c in _CAMPOS_CABECALHO):
+                    break
+        return campos
+
+    def _localizar_secao_vantagens(self, text: str) -> Optional[str]:
+        """Retorna as linhas entre o cabeçalho da tabela de vantagens e o seu total"""
+        inicio = _RE_INICIO_VANTAGENS.search(text)
+        if not inicio:
             return None
+        cabecalho = _RE_CABECALHO_TABELA.search(text, inicio.end())
+        if not cabecalho:
+            return None
+        
+        # A tabela começa na linha seguinte ao cabeçalho
+        corpo = text.find('\n', cabecalho.end())
+        if corpo < 0:
+            return None
+        corpo += 1
+        
+        fim = _RE_FIM_VANTAGENS.search(text, corpo)
+        if fim:
+            return text[corpo:fim.start()]
+        return text[corpo:].removesuffix('\n')
 
     def _extrair_vantagens(self, text: str) -> List[Dict]:
         """Extrai e filtra as vantagens específicas"""
         vantagens = []
         
         # Encontra a seção de vantagens (com mais tolerância)
-        secao = re.search(
-            r"(?:VANTAGENS|PROVENTOS).*?(?:cód|COD|DISCRIMINAÇÃO).*?\n(.*?)(?=TOTAL\s+DE\s+VANTAGENS|\n\n|$)",
-            text, re.DOTALL | re.IGNORECASE
-        )
+        secao = self._localizar_secao_vantagens(text)
         
-        if not secao:
+        if secao is None:
             return vantagens
             
-        # Padrões para linhas da tabela
-        padroes = [
-            r"(\d{5})\s+([A-ZÀ-Ú./\s-]+?)\s+([\d.,]+)%?\s+([\d.,]+)",  # Com percentual
-            r"(\d{5})\s+([A-ZÀ-Ú./\s-]+?)\s+([\d.,]+)\s*$"  # Sem percentual
-        ]
-        
-        for linha in secao.group(1).split('\n'):
-            linha = linha.strip()
-            if not linha:
+        alvos = self.vantagens_alvo
+        for match in _RE_VANTAGEM.finditer(secao):
+            cod = match["cod"]
+            alvo = alvos.get(cod)
+            if alvo is None:
                 continue
+            descricao, tem_percentual = alvo
                 
-            for padrao in padroes:
-                if match := re.match(padrao, linha, re.IGNORECASE):
-                    cod = match.group(1)
-                    if cod in self.vantagens_alvo:
-                        vantagem = {
-                            "codigo": cod,
-                            "descricao": self.vantagens_alvo[cod]['descricao'],
-                            "valor": self._parse_valor(match.group(-1))  # Último grupo é sempre o valor
-                        }
-                        
-                        # Adiciona percentual se aplicável
-                        if self.vantagens_alvo[cod]['tem_percentual'] and len(match.groups()) >= 3:
-                            vantagem["percentual_duracao"] = self._parse_valor(match.group(3))
-                            
-                        vantagens.append(vantagem)
-                    break
+            vantagem = {
+                "codigo": cod,
+                "descricao": descricao,
+                "valor": self._parse_valor(match["valor"])
+            }
+            
+            # Adiciona percentual se aplicável
+            if tem_percentual and match["pct"] is not None:
+                vantagem["percentual_duracao"] = self._parse_valor(match["pct"])
+                
+            vantagens.append(vantagem)
                     
         return vantagens
 
     def _parse_valor(self, valor_str: str) -> float:
         """Converte valores brasileiros para float"""
         try:
-            return float(valor_str.replace('.', '').replace(',', '.'))
+            return float(valor_str.translate(_TRADUCAO_VALOR))
         except:
             return 0.0  # Retorna 0 se não conseguir converter
 
+# Instância única, compartilhada por todas as requisições
+_PROCESSOR = ContrachequeProcessor()
+
+def get_processor() -> ContrachequeProcessor:
+    """Retorna o processador compartilhado"""
+    return _PROCESSOR
+
+def _salvar_upload(origem: BinaryIO, pasta: Optional[str]) -> Tuple[str, str]:
+    """Copia o upload em blocos para um temporário exclusivo e retorna o caminho e o hash"""
+    hash_pdf = hashlib.blake2b(digest_size=16)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", dir=pasta, delete=False) as destino:
+        try:
+            while chunk := origem.read(_TAMANHO_BLOCO):
+                destino.write(chunk)
+                hash_pdf.update(chunk)
+            # Grava o que restou no buffer aqui, para que falta de espaço também remova o parcial
+            destino.flush()
+        except BaseException:
+            os.remove(destino.name)
+            raise
+    return destino.name, hash_pdf.hexdigest()
+
+def _salvar_upload_com_fallback(origem: BinaryIO) -> Tuple[str, str]:
+    """Salva o upload na pasta configurada, recorrendo à pasta temporária padrão se ela falhar
+    (ex.: tmpfs cheio)"""
+    if _PASTA_UPLOADS is not None:
+        try:
+            return _salvar_upload(origem, _PASTA_UPLOADS)
+        except OSError:
+            origem.seek(0)
+    return _salvar_upload(origem, None)
+
 @app.post("/processar")
-async def processar_contracheque(file: UploadFile = File(...)):
+async def processar_contracheque(
+    file: UploadFile = File(...),
+    processor: ContrachequeProcessor = Depends(get_processor)
+):
     """Endpoint otimizado para processamento de contracheques"""
-    temp_path = "temp_contracheque.pdf"
+    temp_path = None
     try:
-        # Salva o arquivo temporariamente
-        with open(temp_path, "wb") as f:
-            f.write(await file.read())
+        # Salva o arquivo em blocos, num temporário exclusivo da requisição
+        temp_path, chave = await run_in_threadpool(_salvar_upload_com_fallback, file.file)
+        
+        # O mesmo PDF sempre produz o mesmo resultado
+        resultado = _CACHE_RESULTADOS.get(chave)
+        if resultado is not None:
+            return resultado
         
-        processor = ContrachequeProcessor()
-        return processor.processar_documento(temp_path)
+        # Processamento bloqueante fora do event loop
+        resultado = await run_in_threadpool(processor.processar_documento, temp_path)
+        _CACHE_RESULTADOS.put(chave, resultado)
+        return resultado
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
     finally:
-        if os.path.exists(temp_path):
+        if temp_path and os.path.exists(temp_path):
             os.remove(temp_path)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(
+        "main:app", host="0.0.0.0", port=8000,
+        workers=_WORKERS_UVICORN, loop="uvloop", http="httptools"
+    )
\ No newline at end of file